@@ -6,268 +6,724 @@ DEBUG: File Watcher Macro - Lots of debug output
 
 import FreeCAD as App
 import FreeCADGui as Gui
+import __future__
+import ast
+import collections
+import glob
+import hashlib
+import logging
 import os
 import sys
+import select
+import struct
 import subprocess
 import threading
 import time
 from PySide2 import QtCore
 
+# Log records are buffered here as (levelno, message) and flushed to the
+# console on the GUI thread
+_log_buf = collections.deque(maxlen=4096)
+
+def _console_writer(levelno):
+    """FreeCAD console function matching the severity of a log level"""
+    if levelno >= logging.ERROR:
+        return App.Console.PrintError
+    if levelno >= logging.WARNING:
+        return App.Console.PrintWarning
+    return App.Console.PrintMessage
+
+class FreeCADConsoleHandler(logging.Handler):
+    """Logging handler that queues records for the FreeCAD console
+    
+    Warnings and errors raised on the main thread are written straight
+    away - the flush timer may not be running yet.
+    """
+    
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            if record.levelno >= logging.WARNING and threading.current_thread() is threading.main_thread():
+                _flush_log()  # keep earlier buffered lines in order
+                _console_writer(record.levelno)(msg + "\n")
+            else:
+                _log_buf.append((record.levelno, msg))
+        except Exception:
+            self.handleError(record)
+
+def _flush_log():
+    """Drain the log buffer to the FreeCAD console, one write per run of equal severity"""
+    write, lines = None, []
+    while _log_buf:
+        levelno, msg = _log_buf.popleft()
+        writer = _console_writer(levelno)
+        if lines and writer != write:
+            write("\n".join(lines) + "\n")
+            lines = []
+        write = writer
+        lines.append(msg)
+    if lines:
+        write("\n".join(lines) + "\n")
+
+# Quiet by default - set FREECAD_MACRO_DEBUG=1 for the full play-by-play
+log = logging.getLogger("freecad.codemacro")
+log.setLevel(logging.DEBUG if os.environ.get("FREECAD_MACRO_DEBUG") == "1" else logging.WARNING)
+log.propagate = False
+if not log.handlers:  # re-running the macro must not stack handlers
+    log.addHandler(FreeCADConsoleHandler())
+
 try:
     from watchdog.observers import Observer
-    from watchdog.events import FileSystemEventHandler
+    from watchdog.events import PatternMatchingEventHandler
     WATCHDOG_AVAILABLE = True
-    print("✓ Watchdog imported successfully")
+    log.debug("✓ Watchdog imported successfully")
 except ImportError as e:
     WATCHDOG_AVAILABLE = False
-    print(f"✗ Watchdog import failed: {e}")
+    PatternMatchingEventHandler = object  # keep DebugFileHandler definable
+    log.info("✗ Watchdog import failed: %s", e)
+
+# Raw inotify via libc - preferred fallback on Linux when watchdog is missing
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+try:
+    import ctypes
+    import ctypes.util
+    if not sys.platform.startswith("linux"):
+        raise OSError("inotify is Linux only")
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = os.O_CLOEXEC
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.inotify_init1.argtypes = [ctypes.c_int]
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    INOTIFY_AVAILABLE = True
+    log.debug("✓ inotify available via libc")
+except (OSError, AttributeError) as e:
+    INOTIFY_AVAILABLE = False
+    log.info("✗ inotify not available: %s", e)
 
 # Global variables
 observer = None
 polling_thread = None
 reloader = None
+log_timer = None
+
+# Longest we wait for a watcher thread when stopping - they are daemons anyway
+SHUTDOWN_TIMEOUT = 0.5
+
+# Compiled geometry code (one code object per top-level statement),
+# keyed by (path, content digest) - mtime and size can repeat across saves.
+# A small LRU, so undoing an edit (A -> B -> A) reuses A's bytecode.
+_code_cache = collections.OrderedDict()
+_code_cache_lock = threading.Lock()  # compile jobs may overlap on the pool
+CODE_CACHE_SIZE = 8
+
+# Modules every geometry script gets, built on first reload
+_BASE_NS = None
+
+# Per-thread cache of threading.current_thread().name
+_tls = threading.local()
+
+def _thread_name():
+    """Name of the calling thread, looked up once per thread"""
+    name = getattr(_tls, "name", None)
+    if name is None:
+        name = threading.current_thread().name
+        _tls.name = name
+    return name
+
+def _read_source(path):
+    """Read the geometry file once on the watcher thread
+    
+    Returns (data, cache_key, digest), or None if the file can't be read.
+    """
+    try:
+        # Plain read(), not mmap: a mapped file truncated mid-save raises SIGBUS
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        log.warning("✗ Could not read file: %s", e)
+        return None
+    
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    return data, (path, digest), digest
+
+def _try_import(name):
+    """Import an optional FreeCAD module, None if it is not available"""
+    try:
+        return __import__(name)
+    except ImportError:
+        return None
+
+def _get_base_ns():
+    """Namespace template shared by all reloads - copy it, don't mutate it"""
+    global _BASE_NS
+    if _BASE_NS is None:
+        ns = {
+            'App': App,
+            'Gui': Gui,
+            'FreeCAD': App,
+            'FreeCADGui': Gui,
+        }
+        
+        # Add modules
+        for name in ('Part',):
+            module = _try_import(name)
+            if module is not None:
+                ns[name] = module
+                log.debug("✓ %s module added", name)
+            else:
+                log.debug("✗ %s module not available", name)
+        _BASE_NS = ns
+    return _BASE_NS
+
+def _future_flags(tree):
+    """Compiler flags for the module's __future__ imports
+    
+    Needed because each statement is compiled on its own.
+    """
+    flags = 0
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+            for alias in node.names:
+                feature = getattr(__future__, alias.name, None)
+                if feature is not None:
+                    flags |= feature.compiler_flag
+    return flags
+
+class _CompileJob(QtCore.QRunnable):
+    """Compiles geometry source on a pool thread, results go back via reloader signals"""
+    
+    def __init__(self, reloader, generation, python_file_path, data, cache_key):
+        super().__init__()
+        self.reloader = reloader
+        self.generation = generation
+        self.python_file_path = python_file_path
+        self.data = data
+        self.cache_key = cache_key
+    
+    def run(self):
+        log.debug("🔧 COMPILE JOB: %s", self.python_file_path)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("   Thread: %s", _thread_name())
+        
+        try:
+            with _code_cache_lock:
+                code_objs = _code_cache.get(self.cache_key)
+                if code_objs is not None:
+                    _code_cache.move_to_end(self.cache_key)
+            if code_objs is None:
+                log.debug("🔧 Compiling geometry code...")
+                # Statement by statement, so the main thread can check its deadline in between
+                tree = ast.parse(self.data, filename=self.python_file_path)
+                flags = _future_flags(tree)
+                code_objs = [
+                    compile(ast.Module([node], type_ignores=[]), self.python_file_path,
+                            'exec', flags=flags, dont_inherit=True)
+                    for node in tree.body
+                ]
+                with _code_cache_lock:
+                    _code_cache[self.cache_key] = code_objs
+                    while len(_code_cache) > CODE_CACHE_SIZE:
+                        _code_cache.popitem(last=False)
+            else:
+                log.debug("✓ Using cached bytecode")
+        except Exception as e:
+            log.debug("Compile failed", exc_info=True)
+            self.reloader.compile_failed_signal.emit(f"💥 ERROR during reload: {str(e)}")
+            return
+        
+        self.reloader.compiled_signal.emit(self.generation, self.python_file_path, code_objs)
 
 class ThreadSafeReloader(QtCore.QObject):
-    """Thread-safe geometry reloader with debug output"""
+    """Thread-safe geometry reloader with debug output
     
-    reload_signal = QtCore.Signal(str)
+    Watcher thread reads the file -> debounce on the main thread ->
+    compile on a pool thread -> exec/recompute back on the main thread.
+    """
+    
+    reload_signal = QtCore.Signal(str, bytes, object)
+    compiled_signal = QtCore.Signal(int, str, object)
+    compile_failed_signal = QtCore.Signal(str)
+    
+    # A runaway script is stopped after this many seconds (checked between statements)
+    exec_timeout = 10.0
+    # Let Qt process events every this many top-level statements
+    pump_every = 20
     
     def __init__(self):
         super().__init__()
-        self.reload_signal.connect(self.reload_geometry_safe)
-        print("✓ ThreadSafeReloader created and signal connected")
+        # Trailing-edge debounce: a burst of saves results in a single reload
+        self._pending = None
+        self._debounce = QtCore.QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(150)
+        self._debounce.timeout.connect(self._do_reload)
+        # Bumped per compile job so a slow, older job can't overwrite newer geometry
+        self._generation = 0
+        self._pool = QtCore.QThreadPool.globalInstance()
+        # processEvents() inside _apply_code can deliver the next result early
+        self._applying = False
+        self._queued = None
+        self.reload_signal.connect(self._schedule_reload)
+        self.compiled_signal.connect(self._apply_code, QtCore.Qt.QueuedConnection)
+        self.compile_failed_signal.connect(self._report_error, QtCore.Qt.QueuedConnection)
+        log.debug("✓ ThreadSafeReloader created and signal connected")
     
-    def request_reload(self, python_file_path):
-        """Request a reload from any thread"""
-        print(f"🔄 RELOAD REQUESTED: {python_file_path}")
-        print(f"   Thread: {threading.current_thread().name}")
-        self.reload_signal.emit(python_file_path)
-        print("   Signal emitted")
+    def request_reload(self, python_file_path, data, cache_key):
+        """Request a reload from any thread with the bytes the watcher already read"""
+        log.debug("🔄 RELOAD REQUESTED: %s (%s bytes)", python_file_path, len(data))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("   Thread: %s", _thread_name())
+        self.reload_signal.emit(python_file_path, data, cache_key)
+        log.debug("   Signal emitted")
     
-    def reload_geometry_safe(self, python_file_path):
-        """This runs on the main thread"""
-        print(f"🎯 RELOAD EXECUTING ON MAIN THREAD: {python_file_path}")
-        print(f"   Thread: {threading.current_thread().name}")
+    def _schedule_reload(self, python_file_path, data, cache_key):
+        """Runs on the main thread - keep the newest content and restart the timer"""
+        self._pending = (python_file_path, data, cache_key)
+        self._debounce.start()
+    
+    def _do_reload(self):
+        """Debounce timer fired - hand the newest content to a compile job"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        self._generation += 1
+        self._pool.start(_CompileJob(self, self._generation, *pending))
+        log.debug("   Compile job #%s submitted", self._generation)
+    
+    def _apply_code(self, generation, python_file_path, code_objs):
+        """This runs on the main thread - FreeCAD API calls must stay here"""
+        log.debug("🎯 RELOAD EXECUTING ON MAIN THREAD: %s", python_file_path)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("   Thread: %s", _thread_name())
+        
+        if generation != self._generation:
+            log.debug("   Stale compile job #%s, skipping", generation)
+            return
         
+        if self._applying:
+            log.debug("   Previous reload still running, queueing #%s", generation)
+            self._queued = (generation, python_file_path, code_objs)
+            return
+        
+        self._applying = True
         try:
-            # Check if file exists and is readable
-            if not os.path.exists(python_file_path):
-                print(f"✗ File does not exist: {python_file_path}")
-                return
-            
-            print(f"✓ File exists, reading...")
-            with open(python_file_path, 'r', encoding='utf-8') as f:
-                code = f.read()
-            
-            print(f"✓ Read {len(code)} characters")
-            
-            # Create namespace
-            namespace = {
-                'App': App,
-                'Gui': Gui,
-                'FreeCAD': App,
-                'FreeCADGui': Gui,
-                '__file__': python_file_path,
-                '__name__': '__main__'
-            }
-            
-            # Add modules
-            try:
-                import Part
-                namespace['Part'] = Part
-                print("✓ Part module added")
-            except ImportError:
-                print("✗ Part module not available")
+            self._run_statements(generation, python_file_path, code_objs)
+        finally:
+            self._applying = False
+        
+        queued, self._queued = self._queued, None
+        if queued is not None:
+            self._apply_code(*queued)
+    
+    def _run_statements(self, generation, python_file_path, code_objs):
+        """Exec the script one top-level statement at a time, then recompute"""
+        try:
+            # Fresh copy per reload so top-level names don't leak between runs
+            namespace = _get_base_ns().copy()
+            namespace['__file__'] = python_file_path
+            namespace['__name__'] = '__main__'
             
-            print("🔧 Executing geometry code...")
-            exec(code, namespace)
-            print("✅ Code execution completed")
+            log.debug("🔧 Executing geometry code (%s statements)...", len(code_objs))
+            deadline = time.monotonic() + self.exec_timeout
+            for i, code_obj in enumerate(code_objs, 1):
+                exec(code_obj, namespace)
+                
+                if i < len(code_objs) and time.monotonic() > deadline:
+                    # Half-built geometry - don't recompute or report success
+                    self._report_error(f"💥 Geometry script timed out after {self.exec_timeout}s "
+                                       f"(stopped after statement {i} of {len(code_objs)})")
+                    return
+                
+                if i % self.pump_every == 0:
+                    QtCore.QCoreApplication.processEvents(QtCore.QEventLoop.AllEvents, 1)
+                    if generation != self._generation:
+                        log.debug("   Reload #%s superseded by a newer save", generation)
+                        return
+            log.debug("✅ Code execution completed")
             
             # GUI updates
             if App.ActiveDocument:
-                print("🔄 Recomputing document...")
+                log.debug("🔄 Recomputing document...")
                 App.ActiveDocument.recompute()
-                print("🖼️ Updating GUI...")
+                log.debug("🖼️ Updating GUI...")
                 Gui.updateGui()
-                print("✅ RELOAD COMPLETE!")
+                log.debug("✅ RELOAD COMPLETE!")
                 App.Console.PrintMessage(">>> Geometry updated from file! <<<\n")
             else:
-                print("⚠️ No active document to recompute")
+                log.debug("⚠️ No active document to recompute")
             
         except Exception as e:
-            error_msg = f"💥 ERROR during reload: {str(e)}"
-            print(error_msg)
-            App.Console.PrintError(f"{error_msg}\n")
-            import traceback
-            traceback.print_exc()
+            log.debug("Reload failed", exc_info=True)
+            self._report_error(f"💥 ERROR during reload: {str(e)}")
+    
+    def _report_error(self, error_msg):
+        """This runs on the main thread"""
+        App.Console.PrintError(f"{error_msg}\n")
 
-class DebugFileHandler(FileSystemEventHandler):
-    """File handler with extensive debug output"""
+class DebugFileHandler(PatternMatchingEventHandler):
+    """File handler with extensive debug output
+    
+    Watchdog drops events for every other file in the directory before
+    any of our handlers run.
+    """
+    
+    __slots__ = ('python_file_path', '_last_hash')
     
     def __init__(self, python_file_path):
+        super().__init__(patterns=[glob.escape(python_file_path)],
+                         ignore_directories=True, case_sensitive=True)
         self.python_file_path = python_file_path
-        self.last_modified = 0
-        print(f"📁 FileHandler created for: {python_file_path}")
+        self._last_hash = b""
+        log.debug("📁 FileHandler created for: %s", python_file_path)
         
     def on_any_event(self, event):
-        print(f"📂 FILE EVENT: {event.event_type} - {event.src_path}")
+        log.debug("📂 FILE EVENT: %s - %s", event.event_type, event.src_path)
         
     def on_modified(self, event):
-        print(f"✏️ MODIFIED EVENT: {event.src_path} (directory: {event.is_directory})")
+        log.debug("✏️ MODIFIED EVENT: %s (directory: %s)", event.src_path, event.is_directory)
         self._check_if_our_file_changed(event)
     
     def on_moved(self, event):
-        print(f"📦 MOVED EVENT: {event.src_path} -> {event.dest_path}")
+        log.debug("📦 MOVED EVENT: %s -> %s", event.src_path, event.dest_path)
         # Check if a temp file was moved to our target file (atomic save)
         if hasattr(event, 'dest_path') and event.dest_path == self.python_file_path:
-            print(f"🎯 TEMP FILE MOVED TO OUR FILE! (Atomic save detected)")
+            log.debug("🎯 TEMP FILE MOVED TO OUR FILE! (Atomic save detected)")
             self._trigger_reload()
         else:
-            print(f"   Not our file (wanted: {self.python_file_path})")
+            log.debug("   Not our file (wanted: %s)", self.python_file_path)
     
     def _check_if_our_file_changed(self, event):
-        """Check if this event affects our file"""
-        if event.is_directory:
-            print("   Ignoring directory event")
-            return
-            
-        if event.src_path != self.python_file_path:
-            print(f"   Not our file, ignoring (wanted: {self.python_file_path})")
-            return
-        
-        print(f"🎯 OUR FILE WAS MODIFIED!")
+        """Only our file gets here - the pattern filter already matched it"""
+        log.debug("🎯 OUR FILE WAS MODIFIED!")
         self._trigger_reload()
     
     def _trigger_reload(self):
-        """Trigger a reload with debouncing"""
-        # Debounce check
-        current_time = time.time()
-        time_diff = current_time - self.last_modified
-        print(f"   Time since last: {time_diff:.2f}s")
+        """Trigger a reload - debouncing happens in the reloader"""
+        source = _read_source(self.python_file_path)
+        if source is None:
+            return
+        data, cache_key, digest = source
         
-        if time_diff < 1:
-            print("   DEBOUNCED - too soon")
+        # Editors and formatters often rewrite identical bytes
+        if digest == self._last_hash:
+            log.debug("   Content unchanged - skipping reload")
             return
-            
-        self.last_modified = current_time
-        print(f"   Processing change...")
+        self._last_hash = digest
+        log.debug("   Processing change...")
         
         # Request reload
         global reloader
         if reloader:
-            reloader.request_reload(self.python_file_path)
+            reloader.request_reload(self.python_file_path, data, cache_key)
         else:
-            print("✗ No reloader available!")
+            log.warning("✗ No reloader available!")
 
-class DebugPollingWatcher:
-    """Polling watcher with debug output"""
+class _LinuxInotifyWatcher:
+    """inotify watcher - blocks in poll() instead of polling the file"""
+    
+    __slots__ = ('file_path', 'file_name', 'running', 'thread', '_last_hash', '_fd', '_rfd', '_wfd',
+                 '_poller')
     
     def __init__(self, file_path):
+        self.file_path = file_path
+        self.file_name = os.fsencode(os.path.basename(file_path))
+        self.running = False
+        self._last_hash = b""
+        
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        
+        # Watch the directory, not the file: atomic saves replace the inode
+        watch_dir = os.fsencode(os.path.dirname(file_path))
+        wd = _libc.inotify_add_watch(self._fd, watch_dir, IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, f"inotify_add_watch failed: {os.strerror(err)}")
+        
+        # Self-pipe so stop() can wake poll() even if the kernel dropped the watch
+        try:
+            self._rfd, self._wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        except OSError:
+            os.close(self._fd)
+            raise
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLIN)
+        self._poller.register(self._rfd, select.POLLIN)
+        log.debug("👁️ InotifyWatcher created for: %s", file_path)
+        
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._watch, name="GeometryInotifyThread")
+        self.thread.daemon = True
+        self.thread.start()
+        log.debug("👁️ Inotify thread started: %s", self.thread.name)
+        
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        os.write(self._wfd, b"x")
+        os.close(self._wfd)
+        self.thread.join(timeout=SHUTDOWN_TIMEOUT)
+        log.debug("👁️ Inotify thread stop requested")
+        
+    def _watch(self):
+        log.debug("👁️ Inotify loop started in thread: %s", _thread_name())
+        
+        try:
+            self._watch_loop()
+        finally:
+            os.close(self._fd)
+            os.close(self._rfd)
+        log.debug("👁️ Inotify loop ended")
+        
+    def _watch_loop(self):
+        while self.running:
+            try:
+                ready = [fd for fd, _ in self._poller.poll()]
+                if self._fd not in ready:
+                    continue  # woken by stop()
+                try:
+                    buf = os.read(self._fd, 4096)
+                except BlockingIOError:
+                    continue
+                
+                changed = False
+                offset = 0
+                while offset + INOTIFY_EVENT.size <= len(buf):
+                    wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(buf, offset)
+                    offset += INOTIFY_EVENT.size
+                    name = buf[offset:offset + length].rstrip(b"\0")
+                    offset += length
+                    if name == self.file_name:
+                        changed = True
+                
+                if changed and self.running:
+                    log.debug("👁️ INOTIFY DETECTED CHANGE!")
+                    log.debug("   File: %s", self.file_path)
+                    
+                    source = _read_source(self.file_path)
+                    if source is None:
+                        continue
+                    data, cache_key, digest = source
+                    
+                    if digest == self._last_hash:
+                        log.debug("   Content unchanged - skipping reload")
+                        continue
+                    self._last_hash = digest
+                    
+                    global reloader
+                    if reloader:
+                        reloader.request_reload(self.file_path, data, cache_key)
+                    else:
+                        log.warning("✗ No reloader available!")
+                    
+            except Exception as e:
+                log.warning("💥 Inotify error: %s", e)
+                # Back off for a second, but still wake for stop()
+                pause = select.poll()
+                pause.register(self._rfd, select.POLLIN)
+                pause.poll(1000)
+
+class DebugPollingWatcher:
+    """Polling watcher with debug output
+    
+    Sleeps min_interval after a change and doubles the sleep on every
+    quiet check, up to max_interval.
+    """
+    
+    __slots__ = ('file_path', 'last_modified', 'running', 'thread', 'min_interval',
+                 'max_interval', '_last_hash', '_sleep_s', '_rfd', '_wfd', '_poller')
+    
+    def __init__(self, file_path, min_interval=1.0, max_interval=8.0):
         self.file_path = file_path
         self.last_modified = 0
+        self._last_hash = b""
         self.running = False
-        print(f"🔍 PollingWatcher created for: {file_path}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._sleep_s = min_interval
+        
+        # Self-pipe so stop() can wake the thread mid-sleep
+        if hasattr(select, "poll"):
+            if hasattr(os, "pipe2"):
+                self._rfd, self._wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+            else:
+                self._rfd, self._wfd = os.pipe()
+                os.set_blocking(self._rfd, False)
+            self._poller = select.poll()
+            self._poller.register(self._rfd, select.POLLIN)
+        else:  # Windows: select() can't wait on pipes
+            self._rfd = self._wfd = self._poller = None
+        log.debug("🔍 PollingWatcher created for: %s (%ss - %ss)", file_path, min_interval, max_interval)
         
     def start(self):
         self.running = True
         self.thread = threading.Thread(target=self._poll, name="GeometryPollingThread")
         self.thread.daemon = True
         self.thread.start()
-        print(f"🔍 Polling thread started: {self.thread.name}")
+        log.debug("🔍 Polling thread started: %s", self.thread.name)
         
     def stop(self):
+        if not self.running:
+            return
         self.running = False
-        print("🔍 Polling thread stop requested")
+        if self._wfd is not None:
+            os.write(self._wfd, b"x")
+            os.close(self._wfd)
+        self.thread.join(timeout=SHUTDOWN_TIMEOUT)
+        log.debug("🔍 Polling thread stop requested")
+    
+    def _sleep(self, seconds):
+        """Sleep that returns immediately once stop() is called"""
+        if self._poller is None:
+            time.sleep(seconds)
+        else:
+            self._poller.poll(seconds * 1000)
         
     def _poll(self):
-        print(f"🔍 Polling loop started in thread: {threading.current_thread().name}")
-        poll_count = 0
+        log.debug("🔍 Polling loop started in thread: %s", _thread_name())
         
         while self.running:
             try:
-                poll_count += 1
-                if poll_count % 10 == 0:  # Every 10 seconds
-                    print(f"🔍 Polling check #{poll_count}")
+                changed = False
+                try:
+                    st = os.stat(self.file_path)
+                except FileNotFoundError:
+                    log.debug("⚠️ File does not exist: %s", self.file_path)
+                    self._sleep(self._sleep_s)
+                    continue
                 
-                if os.path.exists(self.file_path):
-                    current_modified = os.path.getmtime(self.file_path)
-                    if current_modified > self.last_modified:
-                        if self.last_modified > 0:  # Skip first check
-                            print(f"🔍 POLLING DETECTED CHANGE!")
-                            print(f"   File: {self.file_path}")
-                            print(f"   New mtime: {current_modified}")
-                            print(f"   Old mtime: {self.last_modified}")
-                            
-                            global reloader
-                            if reloader:
-                                reloader.request_reload(self.file_path)
-                            else:
-                                print("✗ No reloader available!")
-                        else:
-                            print(f"🔍 Initial file check - mtime: {current_modified}")
-                        self.last_modified = current_modified
+                current_modified = st.st_mtime_ns
+                if current_modified > self.last_modified:
+                    if self.last_modified > 0:  # Skip first check
+                        log.debug("🔍 POLLING DETECTED CHANGE!")
+                        log.debug("   File: %s", self.file_path)
+                        log.debug("   New mtime: %s", current_modified)
+                        log.debug("   Old mtime: %s", self.last_modified)
+                        changed = True
+                        self._trigger_reload()
+                    else:
+                        log.debug("🔍 Initial file check - mtime: %s", current_modified)
+                    self.last_modified = current_modified
+                
+                # Back off while the file is quiet, snap back after a change
+                if changed:
+                    self._sleep_s = self.min_interval
                 else:
-                    print(f"⚠️ File does not exist: {self.file_path}")
-                    
-                time.sleep(1)
+                    self._sleep_s = min(self._sleep_s * 2, self.max_interval)
+                self._sleep(self._sleep_s)
                 
             except Exception as e:
-                print(f"💥 Polling error: {e}")
-                time.sleep(1)
+                log.warning("💥 Polling error: %s", e)
+                self._sleep(self._sleep_s)
+        
+        if self._rfd is not None:
+            os.close(self._rfd)
+        log.debug("🔍 Polling loop ended")
+    
+    def _trigger_reload(self):
+        """Read the changed file and hand it to the reloader"""
+        source = _read_source(self.file_path)
+        if source is None:
+            return
+        data, cache_key, digest = source
         
-        print("🔍 Polling loop ended")
+        if digest == self._last_hash:
+            log.debug("   Content unchanged - skipping reload")
+            return
+        self._last_hash = digest
+        
+        global reloader
+        if reloader:
+            reloader.request_reload(self.file_path, data, cache_key)
+        else:
+            log.warning("✗ No reloader available!")
 
 def start_debug_watcher(python_file_path):
     """Start file watcher with debug output"""
     global observer, polling_thread, reloader
     
-    print(f"🚀 Starting file watcher for: {python_file_path}")
+    log.debug("🚀 Starting file watcher for: %s", python_file_path)
+    
+    # Only one watcher may be active at a time. Re-running the macro resets
+    # this module's globals, so the stop hook is kept on App, which persists.
+    previous_stop = getattr(App, "_code_macro_stop", None)
+    if previous_stop is not None:
+        previous_stop()
+    App._code_macro_stop = stop_debug_watcher
     
     # Create reloader
     reloader = ThreadSafeReloader()
     
     if WATCHDOG_AVAILABLE:
         try:
-            print("📂 Trying watchdog observer...")
+            log.debug("📂 Trying watchdog observer...")
             event_handler = DebugFileHandler(python_file_path)
             observer = Observer()
             observer.schedule(event_handler, path=os.path.dirname(python_file_path), recursive=False)
             observer.start()
-            print("✅ Watchdog observer started successfully!")
+            log.debug("✅ Watchdog observer started successfully!")
+            return True
+        except Exception as e:
+            observer = None
+            log.warning("💥 Watchdog failed: %s", e)
+    
+    # Fallback to inotify
+    if INOTIFY_AVAILABLE:
+        try:
+            log.debug("👁️ Trying inotify watcher...")
+            polling_thread = _LinuxInotifyWatcher(python_file_path)
+            polling_thread.start()
+            log.debug("✅ Inotify watcher started successfully!")
             return True
         except Exception as e:
-            print(f"💥 Watchdog failed: {e}")
+            polling_thread = None
+            log.warning("💥 Inotify failed: %s", e)
     
-    # Fallback to polling
-    print("🔍 Falling back to polling watcher...")
+    # Last resort: stat polling
+    log.debug("🔍 Falling back to polling watcher...")
     polling_thread = DebugPollingWatcher(python_file_path)
     polling_thread.start()
-    print("✅ Polling watcher started!")
+    log.debug("✅ Polling watcher started!")
     return True
 
 def stop_debug_watcher():
     """Stop watchers"""
     global observer, polling_thread
     
-    print("🛑 Stopping watchers...")
+    log.debug("🛑 Stopping watchers...")
     
     if observer:
         observer.stop()
-        observer.join()
+        observer.join(timeout=SHUTDOWN_TIMEOUT)
         observer = None
-        print("✅ Watchdog observer stopped")
+        log.debug("✅ Watchdog observer stopped")
     
     if polling_thread:
         polling_thread.stop()
         polling_thread = None
-        print("✅ Polling watcher stopped")
+        log.debug("✅ Polling watcher stopped")
+    
+    if getattr(App, "_code_macro_stop", None) is stop_debug_watcher:
+        App._code_macro_stop = None
+    
+    _flush_log()
 
 def main():
     """Debug main function"""
-    print("🚀 === DEBUG MACRO START ===")
+    global log_timer
+    
+    log.debug("🚀 === DEBUG MACRO START ===")
     
     if not App.ActiveDocument or not App.ActiveDocument.FileName:
-        print("✗ Need saved document")
+        log.warning("✗ Need saved document")
         return
     
     # Get paths
@@ -276,25 +732,41 @@ def main():
     doc_name = os.path.splitext(os.path.basename(doc_path))[0]
     python_file_path = os.path.join(doc_dir, doc_name + "_geometry.py")
     
-    print(f"📄 Document: {doc_path}")
-    print(f"🐍 Python file: {python_file_path}")
-    print(f"📁 Directory writable: {os.access(doc_dir, os.W_OK)}")
-    print(f"📄 Python file exists: {os.path.exists(python_file_path)}")
+    log.debug("📄 Document: %s", doc_path)
+    log.debug("🐍 Python file: %s", python_file_path)
+    log.debug("📁 Directory writable: %s", os.access(doc_dir, os.W_OK))
+    log.debug("📄 Python file exists: %s", os.path.exists(python_file_path))
     
     if os.path.exists(python_file_path):
         mtime = os.path.getmtime(python_file_path)
-        print(f"📅 File mtime: {mtime}")
+        log.debug("📅 File mtime: %s", mtime)
+    
+    # Drain buffered debug output on the GUI thread
+    if log_timer is None:
+        log_timer = QtCore.QTimer()
+        log_timer.setInterval(250)
+        log_timer.timeout.connect(_flush_log)
+        log_timer.start()
     
     # Start watcher
     if start_debug_watcher(python_file_path):
-        print("✅ Debug watcher started!")
-        App.Console.PrintMessage("Debug file watcher is running. Check console for detailed output.\n")
-        App.Console.PrintMessage("Edit and save the Python file to see debug messages.\n")
+        log.debug("✅ Debug watcher started!")
+        App.Console.PrintMessage("File watcher is running. Edit and save the Python file to update the geometry.\n")
+        App.Console.PrintMessage("Start FreeCAD with FREECAD_MACRO_DEBUG=1 for detailed debug output.\n")
     
-    print("🚀 === DEBUG MACRO COMPLETE ===")
+    log.debug("🚀 === DEBUG MACRO COMPLETE ===")
 
 # Cleanup
+_cleanup_lock = threading.Lock()
+_cleaned = False
+
 def cleanup():
+    """atexit hook - runs at most once and never waits long on watcher threads"""
+    global _cleaned
+    with _cleanup_lock:
+        if _cleaned:
+            return
+        _cleaned = True
     stop_debug_watcher()
 
 import atexit